@@ -0,0 +1,21 @@
+import numpy as np
+from numba import njit, prange
+
+
+@njit(parallel=True)
+def apply_lut(image, lut):
+    # Map an (H, W, 3) uint8 RGB image to LMS using an (R, R, R, 3) LUT as
+    # produced by generate_lut.py, picking the nearest measured grid point
+    height, width = image.shape[0], image.shape[1]
+    steps = lut.shape[0] - 1
+    out = np.empty((height, width, 3), dtype=np.float32)
+    for y in prange(height):
+        for x in range(width):
+            # LUT step i was displayed at round(i * 255 / steps)
+            r = (np.int32(image[y, x, 0]) * steps + 127) // 255
+            g = (np.int32(image[y, x, 1]) * steps + 127) // 255
+            b = (np.int32(image[y, x, 2]) * steps + 127) // 255
+            out[y, x, 0] = lut[r, g, b, 0]
+            out[y, x, 1] = lut[r, g, b, 1]
+            out[y, x, 2] = lut[r, g, b, 2]
+    return out
@@ -3,6 +3,8 @@ import numpy as np
 import time
 from spyderx import SpyderX
 import argparse
+import json
+import os
 # Initialize Pygame
 pygame.init()
 
@@ -11,10 +13,20 @@ WIDTH, HEIGHT = 800, 800
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("RGB to LMS LUT Generator")
 
+# Number of measured colors between checks of the Pygame event queue
+EVENT_POLL_INTERVAL = 16
+
+# Prompt text surface, rendered on first use by wait_for_enter()
+_prompt_text = None
+
 def wait_for_enter():
+    global _prompt_text
+    if _prompt_text is None:
+        font = pygame.font.Font(None, 36)
+        _prompt_text = font.render("Position SpyderX and click to start", True, (0, 0, 0))
+
     screen.fill((255, 255, 255))  # Fill screen with white
-    font = pygame.font.Font(None, 36)
-    text = font.render("Position SpyderX and click to start", True, (0, 0, 0))
+    text = _prompt_text
     text_rect = text.get_rect(center=(WIDTH/2, HEIGHT/2))
     screen.blit(text, text_rect)
     pygame.display.flip()
@@ -33,8 +45,29 @@ def wait_for_enter():
         
     return True
 
-def generate_lut(resolution=16):
-    lut = {}
+def display_values(resolution):
+    # Display value for each LUT step, in the 0-255 range
+    return np.rint(np.linspace(0, 255, resolution)).astype(np.uint8)
+
+def sweep_order(resolution):
+    # Reflected (boustrophedon) Gray code over the RGB grid: b runs back and
+    # forth within each g row and g within each r plane, so consecutive
+    # colors differ by a single step in a single channel
+    for i in range(resolution ** 3):
+        row = i // resolution
+        r = row // resolution
+        g = row % resolution
+        b = i % resolution
+        if r % 2:
+            g = resolution - 1 - g
+        if row % 2:
+            b = resolution - 1 - b
+        yield r, g, b
+
+def generate_lut(resolution=16, settle_base=0.05, settle_scale=0.2):
+    # LMS values indexed by [r, g, b]; colors not yet measured stay NaN
+    lut = np.full((resolution,) * 3 + (3,), np.nan, dtype=np.float32)
+    vals = display_values(resolution)
     spyder = SpyderX()
     spyder.initialize()
 
@@ -49,67 +82,83 @@ def generate_lut(resolution=16):
     pygame.display.flip()
     time.sleep(1)
     spyder.calibrate()
-
-    for r in range(resolution):
-        for g in range(resolution):
-            for b in range(resolution):
-                # Convert to 0-255 range
-                r_255 = int(r * 255 / (resolution - 1))
-                g_255 = int(g * 255 / (resolution - 1))
-                b_255 = int(b * 255 / (resolution - 1))
-
-                # Fill the screen with the color
-                screen.fill((r_255, g_255, b_255))
-                pygame.display.flip()
-
-                # Wait for the display to update and the measurement to stabilize
-                time.sleep(0.25)
-
-                # Measure LMS
-                xyz = spyder.measure()
-                lms = xyz_to_lms(xyz)
-
-                # Store in LUT
-                lut[(r, g, b)] = lms
-
-                # Update progress
-                current_color += 1
-                print(f"Progress: {current_color}/{total_colors} colors measured")
-
-                # Handle Pygame events to keep the window responsive
-                for event in pygame.event.get():
-                    if event.type == pygame.QUIT:
-                        pygame.quit()
-                        spyder.close()
-                        return lut
+    prev_rgb = (0, 0, 0)
+
+    for r, g, b in sweep_order(resolution):
+        # Convert to 0-255 range
+        r_255, g_255, b_255 = int(vals[r]), int(vals[g]), int(vals[b])
+
+        # Fill the screen with the color
+        screen.fill((r_255, g_255, b_255))
+        pygame.display.flip()
+
+        # Wait for the display to update and the measurement to stabilize;
+        # small steps from the previous color settle faster
+        delta = max(abs(r_255 - prev_rgb[0]), abs(g_255 - prev_rgb[1]), abs(b_255 - prev_rgb[2]))
+        time.sleep(settle_base + settle_scale * delta / 255)
+        prev_rgb = (r_255, g_255, b_255)
+
+        # Start the measurement, then do the loop bookkeeping while
+        # the sensor integrates. The next color must not be painted until the
+        # reading is back, since the sensor integrates over the whole transfer,
+        # so painting cannot be pipelined with measuring
+        spyder.measure_async()
+
+        # Update progress
+        current_color += 1
+        print(f"Progress: {current_color}/{total_colors} colors measured")
+
+        # Keep the window responsive, only draining the event queue to check
+        # for QUIT every EVENT_POLL_INTERVAL colors
+        quit_requested = False
+        if current_color % EVENT_POLL_INTERVAL == 0:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    quit_requested = True
+        else:
+            pygame.event.pump()
+
+        # Measure LMS and store in LUT
+        lms = spyder.measure_async_get(lms=True)
+        lut[r, g, b] = lms.astype(np.float32)
+
+        if quit_requested:
+            pygame.quit()
+            spyder.close()
+            return lut
 
     spyder.close()
     pygame.quit()
     return lut
 
-def xyz_to_lms(xyz):
-    # XYZ to LMS conversion matrix (Hunt-Pointer-Estevez)
-    # https://en.wikipedia.org/wiki/LMS_color_space
-    xyz_to_lms_matrix = np.array([
-        [0.4002, 0.7076, -0.0808],
-        [-0.2263, 1.1653, 0.0457],
-        [0.0, 0.0, 0.9182]
-    ])
-    return np.dot(xyz_to_lms_matrix, xyz)
-
 def save_lut(lut, filename='rgb_to_lms_lut.npy'):
+    # Raw float32 array, so it can be loaded with np.load(filename, mmap_mode='r')
     np.save(filename, lut)
-    print(f"LUT saved to {filename}")
+
+    # Describe the array layout in a sidecar .json next to the .npy
+    resolution = lut.shape[0]
+    metadata = {
+        'shape': list(lut.shape),
+        'dtype': str(lut.dtype),
+        'axes': ['r', 'g', 'b', 'lms'],
+        'rgb_values': display_values(resolution).tolist(),
+    }
+    metadata_filename = os.path.splitext(filename)[0] + '.json'
+    with open(metadata_filename, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    print(f"LUT saved to {filename} (metadata in {metadata_filename})")
 
 def main():
     parser = argparse.ArgumentParser(description="RGB to LMS LUT Generator")
     parser.add_argument('-r', '--resolution', type=int, default=16, help="LUT resolution (default: 16)")
     parser.add_argument('-o', '--output_file', type=str, default='rgb_to_lms_lut.npy', help="Output file name (default: rgb_to_lms_lut.npy)")
+    parser.add_argument('--settle-base', type=float, default=0.05, help="Minimum display settling time in seconds (default: 0.05)")
+    parser.add_argument('--settle-scale', type=float, default=0.2, help="Extra settling time in seconds for a full 0-255 color change (default: 0.2)")
     
     args = parser.parse_args()
 
-    lut = generate_lut(resolution=args.resolution)
-    if lut:
+    lut = generate_lut(resolution=args.resolution, settle_base=args.settle_base, settle_scale=args.settle_scale)
+    if lut is not None:
         save_lut(lut, filename=args.output_file)
 
 if __name__ == "__main__":
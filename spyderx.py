@@ -1,4 +1,5 @@
 import os
+import logging
 import usb.core
 import usb.util
 import usb.backend.libusb1
@@ -9,6 +10,15 @@ import numpy as np
 # Replace with the correct path to your libusb library
 LIBUSB_PATH = "/opt/homebrew/Cellar/libusb/1.0.27/lib/libusb-1.0.0.dylib"
 
+logger = logging.getLogger(__name__)
+
+# XYZ to LMS conversion matrix (Hunt-Pointer-Estevez)
+_XYZ_TO_LMS = np.array([
+    [0.4002, 0.7076, -0.0808],
+    [-0.2263, 1.1653, 0.0457],
+    [0.0, 0.0, 0.9182]
+], dtype=np.float32)
+
 
 """
 SpyderX class for interfacing with the SpyderX colorimeter.
@@ -21,6 +31,9 @@ class SpyderX:
     def __init__(self):
         self.dev = None
         self.spyderData = {}
+        # Bulk endpoint addresses; replaced by the enumerated ones in initialize()
+        self.ep_out = 0x01
+        self.ep_in = 0x81
         self.backend = usb.backend.libusb1.get_backend(find_library=lambda x: LIBUSB_PATH)
         if self.backend is None:
             raise ValueError("Libusb backend not found. Check if the path is correct.")
@@ -48,6 +61,8 @@ class SpyderX:
             except usb.core.USBError as e:
                 print(f"Error claiming interface: {e}")
 
+            self._find_endpoints()
+
             self._control_transfer(0x02, 1, 0, 1, None)
             self._control_transfer(0x02, 1, 0, 129, None)
             self._control_transfer(0x41, 2, 2, 0, None)
@@ -67,9 +82,27 @@ class SpyderX:
     def _control_transfer(self, bmRequestType, bRequest, wValue, wIndex, data_or_wLength):
         return self.dev.ctrl_transfer(bmRequestType, bRequest, wValue, wIndex, data_or_wLength)
 
+    def _find_endpoints(self):
+        try:
+            intf = self.dev.get_active_configuration()[(0, 0)]
+        except usb.core.USBError as e:
+            print(f"Error reading interface descriptor: {e}")
+            return
+
+        ep_out = usb.util.find_descriptor(intf, custom_match=lambda e:
+            usb.util.endpoint_type(e.bmAttributes) == usb.util.ENDPOINT_TYPE_BULK and
+            usb.util.endpoint_direction(e.bEndpointAddress) == usb.util.ENDPOINT_OUT)
+        ep_in = usb.util.find_descriptor(intf, custom_match=lambda e:
+            usb.util.endpoint_type(e.bmAttributes) == usb.util.ENDPOINT_TYPE_BULK and
+            usb.util.endpoint_direction(e.bEndpointAddress) == usb.util.ENDPOINT_IN)
+        if ep_out is not None:
+            self.ep_out = ep_out.bEndpointAddress
+        if ep_in is not None:
+            self.ep_in = ep_in.bEndpointAddress
+
     def _bulk_transfer(self, cmd, outSize):
-        self.dev.write(1, cmd)
-        return self.dev.read(0x81, outSize)
+        self.dev.write(self.ep_out, cmd)
+        return self.dev.read(self.ep_in, outSize)
 
     def _get_hardware_version(self):
         out = self._bulk_transfer([0xd9, 0x42, 0x33, 0x00, 0x00], 28)
@@ -81,10 +114,10 @@ class SpyderX:
 
     def _get_factory_calibration(self):
         out = self._bulk_transfer([0xcb, 0x05, 0x73, 0x00, 0x01, 0x00], 47)
-        print(f"Factory calibration raw data: {out}")
+        logger.debug("Factory calibration raw data: %s", out)
         out = out[5:]  # Remove first 5 bytes as in MATLAB code
 
-        matrix = np.zeros((3, 3))
+        matrix = np.zeros((3, 3), dtype=np.float32)
         v1 = out[1]  # MATLAB uses 1-based indexing, so this is correct
         v2 = self._read_nORD_be(out[2:4])
         v3 = out[40]  # 41 in MATLAB, but 40 in 0-based Python indexing
@@ -99,9 +132,12 @@ class SpyderX:
             'v1': v1,
             'v2': v2,
             'v3': v3,
-            'ccmat': np.eye(3)  # This is diag([1 1 1]) in MATLAB
+            'ccmat': np.eye(3, dtype=np.float32)  # This is diag([1 1 1]) in MATLAB
         }
-        print(f"Calibration data: {self.spyderData['calibration']}")
+        logger.debug("Calibration data: %s", self.spyderData['calibration'])
+
+        # Combined raw -> XYZ -> LMS matrix, so that raw @ M yields LMS directly
+        self._raw_to_lms = (matrix @ _XYZ_TO_LMS.T).astype(np.float32)
 
     @staticmethod
     def _read_nORD_be(input_bytes):
@@ -109,17 +145,8 @@ class SpyderX:
 
     @staticmethod
     def _read_IEEE754(input_bytes):
-        # Reverse the byte order as in MATLAB code
-        input_bytes = input_bytes[::-1]
-        
-        # Convert to binary string
-        binary = ''.join(f'{byte:08b}' for byte in input_bytes)
-        
-        sign = int(binary[0])
-        exponent = int(binary[1:9], 2)
-        fraction = int(binary[9:], 2) / 2**23
-
-        return (-1)**sign * (1 + fraction) * 2**(exponent - 127)
+        # Little-endian single-precision float (the MATLAB code reverses the bytes)
+        return struct.unpack('<f', bytes(input_bytes))[0]
 
     def _get_amb_measure(self):
         out = self._bulk_transfer([0xd4, 0xa1, 0xc5, 0x00, 0x02, 0x65, 0x10], 11)
@@ -133,58 +160,84 @@ class SpyderX:
             's3': out[10:14]
         }
 
+        # The measurement command and the s3 offset are fixed once set up
+        v2 = self.spyderData['calibration']['v2']
+        s1 = self.spyderData['settUp']['s1']
+        s2 = self.spyderData['settUp']['s2']
+        self._measure_cmd = b'\xd2\x3f\xb9\x00\x07' + struct.pack('>HB', v2, s1) + bytes(s2)
+        self._s3_slice = np.asarray(self.spyderData['settUp']['s3'][:3], dtype=np.int32)
+
     def calibrate(self):
         if not self.spyderData.get('isOpen', False):
             self.initialize()
+        if self.spyderData.get('isMeasuring', False):
+            raise ValueError("Measurement already in progress")
 
         self._control_transfer(0x41, 2, 2, 0, None)
-        v2 = self.spyderData['calibration']['v2']
-        s1 = self.spyderData['settUp']['s1']
-        s2 = self.spyderData['settUp']['s2']
-
-        send = bytes([v2 >> 8, v2 & 0xFF, s1] + list(s2))
-        out = self._bulk_transfer([0xd2, 0x3f, 0xb9, 0x00, 0x07] + list(send), 13)
-        raw = struct.unpack('>HHHH', out[5:])
-        self.spyderData['bcal'] = np.array(raw[:3]) - np.array(self.spyderData['settUp']['s3'][:3])
+        out = self._bulk_transfer(self._measure_cmd, 13)
+        raw = np.frombuffer(bytes(out[5:13]), dtype='>u2').astype(np.int32)
+        self.spyderData['bcal'] = raw[:3] - self._s3_slice
         self.spyderData['isBlackCal'] = True
 
-    def measure(self):
+    def _start_measurement(self):
         if not self.spyderData.get('isOpen', False):
             raise ValueError("SpyderX not initialized")
         if not self.spyderData.get('isBlackCal', False):
             raise ValueError("Black calibration not performed")
+        if self.spyderData.get('isMeasuring', False):
+            raise ValueError("Measurement already in progress")
 
         self._control_transfer(0x41, 2, 2, 0, None)
-        v2 = self.spyderData['calibration']['v2']
-        s1 = self.spyderData['settUp']['s1']
-        s2 = self.spyderData['settUp']['s2']
+        self.dev.write(self.ep_out, self._measure_cmd)
+        self.spyderData['isMeasuring'] = True
 
-        send = bytes([v2 >> 8, v2 & 0xFF, s1] + list(s2))
-        out = self._bulk_transfer([0xd2, 0x3f, 0xb9, 0x00, 0x07] + list(send), 13)
-        print(out)
-        raw = np.array(struct.unpack('>HHHH', out[5:]))
-        print(raw)
+    def _finish_measurement(self):
+        if not self.spyderData.get('isMeasuring', False):
+            raise ValueError("No measurement in progress")
 
+        try:
+            out = self.dev.read(self.ep_in, 13)
+        finally:
+            self.spyderData['isMeasuring'] = False
+        logger.debug("Measurement raw data: %s", out)
+        # astype copies into a writable native-endian int32 array
+        raw = np.frombuffer(bytes(out[5:13]), dtype='>u2').astype(np.int32)
+
+        raw[:3] = raw[:3] - self._s3_slice - self.spyderData['bcal']
+        logger.debug("Black-corrected counts: %s", raw[:3])
+        # float32 so the matmul with the float32 calibration does not upcast
+        return raw[:3].astype(np.float32)
+
+    def _measure_raw(self):
+        self._start_measurement()
+        return self._finish_measurement()
 
-        raw[:3] = raw[:3] - np.array(self.spyderData['settUp']['s3'][:3]) - self.spyderData['bcal']
-        print(raw[:3])
-        print(self.spyderData['calibration']['matrix'])
-        XYZ = np.dot(raw[:3], self.spyderData['calibration']['matrix'])
+    def measure(self):
+        XYZ = np.dot(self._measure_raw(), self.spyderData['calibration']['matrix'])
         return XYZ
 
+    def measure_lms(self):
+        return self._measure_raw() @ self._raw_to_lms
+
+    def measure_async(self):
+        # Send the measurement command without waiting for the result, so the
+        # caller can do other work while the sensor integrates
+        self._start_measurement()
+
+    def measure_async_get(self, lms=False):
+        # Block until the measurement started by measure_async() is read back
+        raw = self._finish_measurement()
+        if lms:
+            return raw @ self._raw_to_lms
+        return np.dot(raw, self.spyderData['calibration']['matrix'])
+
     def close(self):
         if self.dev:
             usb.util.dispose_resources(self.dev)
         self.spyderData['isOpen'] = False
 
 def xyz_to_lms(xyz):
-    # XYZ to LMS conversion matrix (Hunt-Pointer-Estevez)
-    xyz_to_lms_matrix = np.array([
-        [0.4002, 0.7076, -0.0808],
-        [-0.2263, 1.1653, 0.0457],
-        [0.0, 0.0, 0.9182]
-    ])
-    return np.dot(xyz_to_lms_matrix, xyz)
+    return _XYZ_TO_LMS @ xyz
 
 def main():
     spyder = SpyderX()